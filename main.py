@@ -1,57 +1,485 @@
 # Import necessary modules
 import eel  # For the frontend communication with the Python backend
 import speech_recognition as sr  # For speech recognition
-from openai import OpenAI  # For interacting with OpenAI's GPT model
+import sounddevice as sd  # For streaming raw microphone audio to the Realtime API
+from openai import AsyncOpenAI  # For interacting with OpenAI's GPT model
+import httpx  # For sharing one HTTP/2 connection pool between all OpenAI requests
 import threading  # For handling concurrent tasks
-import json  # For handling JSON data
+import asyncio  # For overlapping listening, OpenAI requests and speech synthesis
+import orjson  # For handling JSON data
 import os  # For interacting with the file system
-import base64  # For encoding audio responses into base64
+import base64  # For encoding microphone audio sent to the Realtime API
+import websockets  # For sending binary audio to the browser outside of eel
+import msgpack  # For packing batches of answer text sent over the stream server
+import hashlib  # For naming cached speech files after the text they contain
 import time  # For time-related tasks like sleep and cooldown
-import re  # For regular expressions (used to check if a string is a question)
+import re  # For regular expressions (used to split answers into sentences)
+import difflib  # For checking whether a speculative answer was started from the right question
+import math  # For converting listening durations into numbers of audio chunks
+import collections  # For keeping the audio captured just before a phrase starts
+import audioop  # For measuring the loudness of microphone audio
+import io  # For building WAV files in memory
+import wave  # For writing recorded audio as WAV before it is sent to Google
+import zipfile  # For recognizing a damaged response cache file
+from concurrent.futures import ThreadPoolExecutor  # For recognizing speech while the next utterance is recorded
+import numpy as np  # For comparing question embeddings in the response cache
+try:
+    import vosk  # For recognizing speech locally while it is being spoken (optional)
+except ImportError:
+    vosk = None
+try:
+    import webrtcvad  # For noticing quickly that the speaker has stopped talking (optional)
+except ImportError:
+    webrtcvad = None
+
+# A sentence and the punctuation that ends it; each sentence is sent to text-to-speech on its own
+SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?\n]+")
+
+# The microphone's noise level is measured briefly and remembered, so later launches within a day
+# can skip the measurement; the threshold keeps adapting while listening
+AUDIO_PROFILE_FILE = 'audio_profile.json'
+AUDIO_PROFILE_MAX_AGE = 24 * 60 * 60  # Seconds
+CALIBRATION_SECONDS = 0.25
+
+# Google recognition runs in its own threads so the microphone can record the next utterance
+# meanwhile; each running recognition holds one of STT_WORKERS reusable recording buffers
+STT_WORKERS = 2
+WAV_BUFFER_BYTES = 256 * 1024  # Starting size of each buffer's in-memory WAV file
+
+# Put a Vosk model (https://alphacephei.com/vosk/models) in this folder to recognize speech
+# locally instead of sending every question to Google
+VOSK_MODEL_DIR = 'model-en'
+
+# With webrtcvad installed, Vosk's answer is finalized once this much silence follows the speech,
+# instead of waiting for Vosk's own, slower endpointing
+VAD_AGGRESSIVENESS = 3  # 0-3, higher filters out more non-speech
+VAD_FRAME_MS = 20
+VAD_SILENCE_SECONDS = 0.2
+VAD_SAMPLE_RATES = (8000, 16000, 32000, 48000)  # The only rates webrtcvad accepts
+
+# While Vosk is still listening, an answer is requested early for a partial question once it has
+# enough words and has stopped changing; it is kept if the final question is close enough
+PREFILL_MIN_WORDS = 4
+PREFILL_STABLE_SECONDS = 0.3
+# With webrtcvad, the VAD ends the utterance sooner than the partial can be stable that long, so
+# the answer is also requested once the speaker has been silent for half of VAD_SILENCE_SECONDS
+PREFILL_SILENCE_SECONDS = VAD_SILENCE_SECONDS / 2
+PREFILL_SIMILARITY = 0.9
+
+# Set USE_REALTIME_API=1 to send microphone audio over a single Realtime API connection
+# instead of separate speech recognition, chat and text-to-speech requests
+USE_REALTIME_API = os.environ.get('USE_REALTIME_API') == '1'
+REALTIME_MODEL = "gpt-4o-realtime-preview"  # Model that listens and answers with speech
+REALTIME_SAMPLE_RATE = 24000  # The Realtime API expects and returns 24 kHz mono PCM16
+REALTIME_FRAME_MS = 20  # Length of each microphone frame sent to the Realtime API
+
+# Answers are cached next to config.json and reused for repeated or paraphrased questions
+RESPONSE_CACHE_FILE = 'cache.npz'
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_SIZE = 1536  # Length of a text-embedding-3-small vector
+SIMILARITY_THRESHOLD = 0.92  # Minimum cosine similarity for two questions to share an answer
+RESPONSE_CACHE_MAX_ENTRIES = 1000  # The oldest answers are forgotten above this number
+
+# Synthesized speech is cached on disk so repeated sentences skip the text-to-speech request
+TTS_VOICE = "alloy"  # Voice used for all spoken answers
+TTS_FORMAT = "opus"  # Smaller than mp3 for the same speech, and decoded natively by the browser
+TTS_CACHE_DIR = 'tts_cache'
+TTS_CACHE_MAX_BYTES = 100 * 1024 * 1024  # Least recently used files are removed above this size
+TTS_CONCURRENCY = 4  # Speech requests sent at once; more would run into OpenAI's rate limits
+TTS_MEMORY_CACHE_SIZE = 256  # Number of recently used sentences whose speech is also kept in memory
+# Short sentences that answers often start or end with; their speech is kept in memory from startup
+CANNED_PHRASES = (
+    "Sure!", "Sure.", "Certainly!", "Of course!", "Great question!", "Good question!",
+    "Yes.", "No.", "I'm not sure.", "I don't know.", "Sorry, I didn't catch that.", "One moment.",
+)
+
+# eel serves the UI on EEL_PORT; the WebSocket server that streams audio to the browser listens on
+# a free port chosen by the system, which the page asks for through get_stream_port
+EEL_PORT = 8000
+STREAM_PORT = 0
+# Only the app's own page may connect; any other page open in the browser could otherwise
+# receive every answer
+STREAM_ORIGINS = [f"http://localhost:{EEL_PORT}", f"http://127.0.0.1:{EEL_PORT}"]
+TEXT_BATCH_SECONDS = 0.05  # Streamed answer text is sent to the browser at most this often
 
 # Initialize eel (web interface)
 eel.init('web')
 
+class StreamServer:
+    # WebSocket server that pushes streamed answers to the browser; eel would have to send audio
+    # as base64 inside JSON and makes a separate call for every text delta. Each message starts
+    # with one byte giving its type.
+    AUDIO_CLIP = 0  # An encoded audio file, decoded by the browser
+    AUDIO_PCM = 1  # Raw 24 kHz PCM16 samples from the Realtime API
+    TEXT = 2  # A msgpack map {"t": text} with the answer text of one batch
+    BEGIN_ANSWER = 3  # No payload; the messages after it belong to a new answer
+    ERROR = 4  # A msgpack map {"t": text} with an error shown in place of the answer
+
+    def __init__(self, port=STREAM_PORT):
+        self.port = port
+        self.clients = set()  # Connected browser windows
+        self.server = None
+        self.text_batch = []  # Answer text waiting to be sent
+        self.flush_handle = None  # Timer that will send text_batch
+
+    async def start(self):
+        # Start accepting connections on the event loop
+        # Bind one address only; with port 0, 'localhost' could get a different port for IPv4 and IPv6
+        self.server = await websockets.serve(self.handle_client, '127.0.0.1', self.port, origins=STREAM_ORIGINS)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def handle_client(self, websocket, path=None):
+        # Keep track of a browser window until it disconnects
+        self.clients.add(websocket)
+        try:
+            await websocket.wait_closed()
+        finally:
+            self.clients.discard(websocket)
+
+    def send(self, kind, payload):
+        # Send a message to every connected browser window (must be called on the event loop)
+        websockets.broadcast(self.clients, bytes([kind]) + payload)
+
+    def send_text(self, text):
+        # Queue answer text; everything queued within TEXT_BATCH_SECONDS is sent as one message
+        self.text_batch.append(text)
+        if self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(TEXT_BATCH_SECONDS, self.flush_text)
+
+    def flush_text(self):
+        # Send the queued answer text now
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.text_batch:
+            self.send(self.TEXT, msgpack.packb({"t": "".join(self.text_batch)}))
+            self.text_batch.clear()
+
+class SemanticCache:
+    # Stores answers with the embedding of their question so similar questions can reuse them.
+    # Only the text is kept; the speech for each sentence comes from the TTS cache.
+    def __init__(self, path=RESPONSE_CACHE_FILE, threshold=SIMILARITY_THRESHOLD, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embeddings = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)  # One unit-length row per answer, oldest first
+        self.questions = []  # Normalized question for each row
+        self.entries = []  # (text response, list of sentences spoken) for each row
+        self.exact = {}  # Normalized question -> row, for lookups that need no embedding
+        self.load()
+
+    @staticmethod
+    def normalize(question):
+        # Questions that only differ in case or surrounding punctuation are the same question
+        return question.lower().strip(" ?.!")
+
+    def get_exact(self, question):
+        # Return the cached answer for exactly this question, if any
+        row = self.exact.get(self.normalize(question))
+        return None if row is None else self.entries[row]
+
+    def search(self, embedding):
+        # Return the answer whose question is most similar to the embedding, if it is similar enough
+        if not self.entries:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = self.embeddings @ (query / np.linalg.norm(query))
+        best = int(similarities.argmax())
+        return self.entries[best] if similarities[best] > self.threshold else None
+
+    def add(self, question, embedding, text_response, sentences):
+        # Remember an answer and the embedding of the question it answers
+        row = np.asarray(embedding, dtype=np.float32)
+        self.embeddings = np.vstack([self.embeddings, row / np.linalg.norm(row)])
+        self.questions.append(self.normalize(question))
+        self.exact[self.questions[-1]] = len(self.entries)
+        self.entries.append((text_response, sentences))
+        if len(self.entries) > self.max_entries:
+            # Forget the oldest answers
+            excess = len(self.entries) - self.max_entries
+            self.embeddings = self.embeddings[excess:]
+            del self.questions[:excess]
+            del self.entries[:excess]
+            self.exact = {question: row for row, question in enumerate(self.questions)}
+
+    def load(self):
+        # Load previously cached answers; an unreadable cache is simply started over
+        try:
+            with np.load(self.path) as data:
+                embeddings = data['embeddings']
+                questions = data['questions'].tolist()
+                texts = data['texts'].tolist()
+                sentences = data['sentences'].tolist()
+                sentence_counts = data['sentence_counts'].tolist()
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return
+
+        # Split the sentences of all answers back into each answer's sentences
+        entries = []
+        offset = 0
+        for text_response, count in zip(texts, sentence_counts):
+            entries.append((text_response, sentences[offset:offset + count]))
+            offset += count
+
+        self.embeddings = embeddings.astype(np.float32, copy=False)
+        self.questions = questions
+        self.entries = entries
+        self.exact = {question: row for row, question in enumerate(questions)}
+
+    def save(self):
+        # Write the cache to disk, replacing the old file only once the new one is complete
+        sentences = [sentence for _, answer_sentences in self.entries for sentence in answer_sentences]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                embeddings=self.embeddings,
+                questions=np.array(self.questions, dtype=str),
+                texts=np.array([text_response for text_response, _ in self.entries], dtype=str),
+                sentences=np.array(sentences, dtype=str),
+                sentence_counts=np.array([len(answer_sentences) for _, answer_sentences in self.entries], dtype=np.int64),
+            )
+        os.replace(tmp_path, self.path)
+
+class TTSCache:
+    # Stores synthesized speech on disk, keyed by the voice and the text that was spoken, with the
+    # most recently used entries also kept in memory
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, memory_size=TTS_MEMORY_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_size = memory_size
+        self.memory = collections.OrderedDict()  # (voice, text) -> speech, least recently used first
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.files())  # Current size of the cache
+
+    def path(self, voice, text):
+        # File that holds the speech for this voice and text
+        key = hashlib.sha256(f"{voice}\0{text}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.{TTS_FORMAT}")
+
+    def files(self):
+        # (last access time, size, path) of every cached speech file, including files in
+        # formats that are no longer requested so they are evicted too
+        with os.scandir(self.directory) as entries:
+            return [
+                (entry.stat().st_atime, entry.stat().st_size, entry.path)
+                for entry in entries if not entry.name.endswith('.tmp')
+            ]
+
+    def get(self, voice, text):
+        # Return the cached speech for the text, or None if it has not been synthesized yet
+        path = self.path(voice, text)
+        audio = self.memory.get((voice, text))
+        if audio is not None:
+            self.memory.move_to_end((voice, text))
+            self.touch(path)  # The file is recently used too, so evict() keeps it
+            return audio
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+        except FileNotFoundError:
+            return None
+        self.touch(path)
+        self.remember(voice, text, audio)
+        return audio
+
+    @staticmethod
+    def touch(path):
+        # Mark a file as recently used, even on filesystems that do not track access times
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # Already evicted; the speech is still in memory
+
+    def remember(self, voice, text, audio):
+        # Keep speech in memory, forgetting the least recently used entry when there are too many
+        self.memory[(voice, text)] = audio
+        self.memory.move_to_end((voice, text))
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def put(self, voice, text, audio):
+        # Save synthesized speech, writing to a temporary file first so readers never see a partial file
+        path = self.path(voice, text)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        self.remember(voice, text, audio)
+        self.total_bytes += len(audio)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Remove the least recently used files until the cache fits within its size limit
+        files = sorted(self.files())
+        self.total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
+
+class PcmBuffer:
+    # Memory for recording and encoding one utterance, reused from one utterance to the next
+    def __init__(self):
+        self.pcm = bytearray()  # Raw samples, grown by listen_pooled when needed
+        self.wav_file = io.BytesIO(bytes(WAV_BUFFER_BYTES))  # Overwritten by every get_wav_data call
+
+class PooledAudioData(sr.AudioData):
+    # AudioData that writes its WAV file (which recognize_google converts to FLAC) into the
+    # buffer's BytesIO instead of a new one on every call
+    def __init__(self, frame_data, sample_rate, sample_width, wav_file):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.wav_file = wav_file
+
+    def get_wav_data(self, convert_rate=None, convert_width=None):
+        raw_data = self.get_raw_data(convert_rate, convert_width)
+        wav_file = self.wav_file
+        wav_file.seek(0)
+        wav_writer = wave.open(wav_file, 'wb')
+        try:
+            wav_writer.setframerate(self.sample_rate if convert_rate is None else convert_rate)
+            wav_writer.setsampwidth(self.sample_width if convert_width is None else convert_width)
+            wav_writer.setnchannels(1)
+            wav_writer.writeframes(raw_data)
+        finally:
+            wav_writer.close()
+        # Return only what was written; anything after it is left over from a longer utterance
+        end = wav_file.tell()
+        wav_file.seek(0)
+        return wav_file.read(end)
+
 class AudioAssistant:
     def __init__(self):
         # Initialize the assistant's parameters and set up the audio system
-        self.setup_audio()
+        # Run listening, OpenAI requests and speech synthesis on a dedicated event loop
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        if not USE_REALTIME_API:
+            self.setup_audio()  # The Realtime API session opens its own microphone stream
         self.is_listening = False  # Flag indicating whether the assistant is listening
         self.client = None  # OpenAI client, initially None
         self.api_key = None  # The API key for OpenAI, initially None
         self.tts_enabled = True  # Set text-to-speech as enabled by default
         self.is_speaking = False  # Flag indicating whether the assistant is speaking
         self.audio_playing = False  # Flag indicating whether audio is being played
+        self.idle = self.create_on_loop(asyncio.Event)  # Set while the assistant is neither speaking nor playing audio
+        self.idle.set()
+        self.prefill = None  # (question, task opening its answer stream) started from a partial transcript
+        self.answer_lock = self.create_on_loop(asyncio.Lock)  # Answers one question at a time
+        self.answers_started = 0  # Number of answers started, to spot recordings made while answering
+        self.last_speak_time = 0  # Track the last time the assistant spoke
+        # One long-lived HTTP/2 client lets chat, embedding and speech requests share a connection
+        # instead of paying for a new TLS handshake when an idle connection has been dropped
+        self.http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=300),
+            timeout=httpx.Timeout(60, connect=5)
+        )
+        self.tts_queue = self.create_on_loop(asyncio.Queue)  # Sentences waiting to be converted to speech
+        self.response_cache = SemanticCache()  # Answers to questions that were already asked
+        self.tts_cache = TTSCache()  # Speech for sentences that were already spoken
+        self.tts_slots = self.create_on_loop(lambda: asyncio.Semaphore(TTS_CONCURRENCY))  # Limits speech requests
+        self.canned_speech = {}  # Speech for CANNED_PHRASES, filled in once there is an API key
+        self.stream_server = StreamServer()  # Sends audio to the browser
+        # Wait for the server so the page never asks for its port too early, and so a failure to
+        # start it is reported instead of leaving the UI without answers
+        asyncio.run_coroutine_threadsafe(self.stream_server.start(), self.loop).result()
+        asyncio.run_coroutine_threadsafe(self.tts_worker(), self.loop)  # Synthesize speech in the background
         self.load_api_key()  # Attempt to load an API key from config.json
 
+    def create_on_loop(self, factory):
+        # Create an asyncio Event, Lock or Queue on the assistant's loop; before Python 3.10 they
+        # bind to the loop that is current where they are created, not the one awaiting them
+        async def create():
+            return factory()
+        return asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+
     def setup_audio(self):
         # Set up the microphone and recognizer for speech input
         self.recognizer = sr.Recognizer()  # Create a recognizer object
         self.mic = sr.Microphone()  # Create a microphone object
-        with self.mic as source:
-            # Adjust the recognizer for ambient noise in the environment
-            self.recognizer.adjust_for_ambient_noise(source)
+        # Open the microphone once and keep it open, instead of reopening the device for every question
+        self.source = self.mic.__enter__()
+        # Adjust the recognizer for ambient noise in the environment
+        self.recognizer.dynamic_energy_threshold = True
+        # Treat a shorter pause as the end of the question, so answering starts sooner
+        self.recognizer.pause_threshold = 0.4  # Seconds of silence that end a phrase
+        self.recognizer.non_speaking_duration = 0.2  # Seconds of silence kept around the phrase
+        self.recognizer.phrase_threshold = 0.2  # Minimum seconds of speech to count as a phrase
+        if not self.load_audio_profile():
+            self.recognizer.adjust_for_ambient_noise(self.source, duration=CALIBRATION_SECONDS)
+            self.save_audio_profile()
+        self.stt_pool = ThreadPoolExecutor(max_workers=STT_WORKERS)  # Runs Google recognition
+        self.pcm_buffers = self.create_on_loop(asyncio.Queue)  # Recording buffers that are not in use
+        for _ in range(STT_WORKERS):
+            self.pcm_buffers.put_nowait(PcmBuffer())
+        self.recognitions = set()  # Recognitions still running, kept so they are not garbage collected
+        # Recognize speech locally with Vosk when a model is available, otherwise use Google
+        self.vosk = None
+        if vosk is not None and os.path.isdir(VOSK_MODEL_DIR):
+            self.vosk = vosk.KaldiRecognizer(vosk.Model(VOSK_MODEL_DIR), self.source.SAMPLE_RATE)
+        self.vad = None
+        if webrtcvad is not None and self.source.SAMPLE_RATE in VAD_SAMPLE_RATES:
+            self.vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+
+    def load_audio_profile(self):
+        # Use the energy threshold measured on a recent launch, returning whether one was found
+        try:
+            if time.time() - os.path.getmtime(AUDIO_PROFILE_FILE) > AUDIO_PROFILE_MAX_AGE:
+                return False
+            with open(AUDIO_PROFILE_FILE, 'rb') as f:
+                self.recognizer.energy_threshold = orjson.loads(f.read())['energy_threshold']
+        except (OSError, orjson.JSONDecodeError, KeyError):
+            return False
+        return True
+
+    def save_audio_profile(self):
+        # Remember the measured energy threshold for the next launch
+        with open(AUDIO_PROFILE_FILE + '.tmp', 'wb') as f:
+            f.write(orjson.dumps({'energy_threshold': self.recognizer.energy_threshold}))
+        os.replace(AUDIO_PROFILE_FILE + '.tmp', AUDIO_PROFILE_FILE)
 
     def load_api_key(self):
         # Load the API key from a config file if it exists
-        if os.path.exists('config.json'):
-            with open('config.json', 'r') as f:
-                config = json.load(f)  # Load the configuration from the file
-                self.set_api_key(config.get('api_key'))  # Set the API key if found
+        try:
+            with open('config.json', 'rb') as f:
+                config = orjson.loads(f.read())  # Load the configuration from the file
+        except FileNotFoundError:
+            return
+        self.set_api_key(config.get('api_key'))  # Set the API key if found
 
     def set_api_key(self, api_key):
         # Set the API key for OpenAI and store it in a configuration file
+        if api_key == self.api_key and self.client is not None:
+            return  # Nothing changed; keep the existing client and its open connections
         self.api_key = api_key
-        self.client = OpenAI(api_key=self.api_key)  # Initialize OpenAI client
-        with open('config.json', 'w') as f:
-            json.dump({'api_key': api_key}, f)  # Save the API key to config.json
+        self.client = AsyncOpenAI(api_key=self.api_key, http_client=self.http_client)  # Initialize OpenAI client
+        asyncio.run_coroutine_threadsafe(self.preload_canned_speech(), self.loop)
+        # Write to a temporary file first so a crash never leaves a half-written config.json
+        with open('config.json.tmp', 'wb') as f:
+            f.write(orjson.dumps({'api_key': api_key}))
+            f.flush()
+            os.fsync(f.fileno())  # Make sure the new config is on disk before it replaces the old one
+        os.replace('config.json.tmp', 'config.json')  # Save the API key to config.json
 
     def delete_api_key(self):
         # Delete the stored API key and remove the configuration file
         self.api_key = None
         self.client = None
-        if os.path.exists('config.json'):
+        try:
             os.remove('config.json')  # Delete the configuration file
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        # Stop listening and close the shared HTTP connections when the app exits
+        self.is_listening = False
+        asyncio.run_coroutine_threadsafe(self.http_client.aclose(), self.loop).result(timeout=5)
 
     def has_api_key(self):
         # Check if the API key exists
@@ -63,113 +491,498 @@ class AudioAssistant:
             return False  # If there's no client, return False
         self.is_listening = not self.is_listening  # Toggle the listening flag
         if self.is_listening:
-            # Start listening in a separate thread
-            threading.Thread(target=self.listen_and_process, daemon=True).start()
+            # Start listening on the assistant's event loop
+            session = self.realtime_session() if USE_REALTIME_API else self.listen_and_process()
+            asyncio.run_coroutine_threadsafe(session, self.loop)
         return self.is_listening
 
-    def listen_and_process(self):
+    async def listen_and_process(self):
         # Main loop for listening to audio and processing the input
         cooldown_time = 2  # Cooldown period in seconds between speech
-        last_speak_time = 0  # Track the last time the assistant spoke
-        
+        loop = asyncio.get_running_loop()
+
         while self.is_listening:
-            current_time = time.time()  # Get the current time
-            if not self.is_speaking and not self.audio_playing and (current_time - last_speak_time) > cooldown_time:
+            # Wait until the assistant has stopped speaking and the cooldown has passed
+            await self.idle.wait()
+            remaining = cooldown_time - (time.time() - self.last_speak_time)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+                continue  # The assistant may have started speaking again in the meantime
+            try:
+                # Listen for audio input from the microphone
+                # (blocking audio calls run in a worker thread so the event loop stays free)
+                if self.vosk is not None:
+                    # Recognize the speech locally as it is captured
+                    text = await loop.run_in_executor(None, self.listen_vosk, 5, 5)
+                    await self.answer(text)
+                    continue
+
+                # Count answers from before waiting for a buffer: a recognition that frees one
+                # may start answering before this loop resumes
+                answers_started = self.answers_started
+                buffer = await self.pcm_buffers.get()
                 try:
-                    # Listen for audio input from the microphone
-                    with self.mic as source:
-                        audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                    # Convert audio to text using Google Speech Recognition
-                    text = self.recognizer.recognize_google(audio)
-                    if self.is_question(text):  # Check if the text is a question
-                        # Capitalize the first letter and ensure it ends with a question mark
-                        capitalized_text = text[0].upper() + text[1:]
-                        if not capitalized_text.endswith('?'):
-                            capitalized_text += '?'
-                        eel.update_ui(f"Q: {capitalized_text}", "")  # Update UI with the question
-                        self.is_speaking = True
-                        response = self.get_ai_response(capitalized_text)  # Get AI's response
-                        eel.update_ui("", f"{response}")  # Update UI with the AI response
-                        self.is_speaking = False
-                        last_speak_time = time.time()  # Update the last speak time
-                except sr.WaitTimeoutError:
-                    pass  # Handle timeout error
-                except sr.UnknownValueError:
-                    pass  # Handle unrecognized speech
-                except Exception as e:
-                    eel.update_ui(f"An error occurred: {str(e)}", "")  # Handle general errors
+                    audio = await loop.run_in_executor(None, self.listen_pooled, buffer, 5, 5)
+                except BaseException:
+                    self.pcm_buffers.put_nowait(buffer)
+                    raise
+                if answers_started != self.answers_started:
+                    # The assistant started answering during the recording, so it may have heard itself
+                    self.pcm_buffers.put_nowait(buffer)
+                    continue
+                # Recognize in the background and go straight back to listening
+                recognition = asyncio.create_task(self.recognize_and_answer(audio, buffer))
+                self.recognitions.add(recognition)
+                recognition.add_done_callback(self.recognitions.discard)
+            except sr.WaitTimeoutError:
+                pass  # Handle timeout error
+            except sr.UnknownValueError:
+                pass  # Handle unrecognized speech
+            except Exception as e:
+                eel.update_ui(f"An error occurred: {str(e)}", "")  # Handle general errors
+            finally:
+                self.cancel_prefill()  # Drop a speculative answer that was not used
+
+    async def recognize_and_answer(self, audio, buffer):
+        # Convert recorded audio to text using Google Speech Recognition, then answer it
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                text = await loop.run_in_executor(self.stt_pool, self.recognizer.recognize_google, audio)
+            finally:
+                self.pcm_buffers.put_nowait(buffer)  # The recording has been sent; the buffer is free
+            await self.answer(text)
+        except sr.UnknownValueError:
+            pass  # Handle unrecognized speech
+        except Exception as e:
+            eel.update_ui(f"An error occurred: {str(e)}", "")  # Handle general errors
+
+    async def answer(self, text):
+        # Show the question and stream the answer to it, one question at a time
+        # Answer everything that was said; a question may not look like one ("Explain transformers")
+        if not text.strip():
+            return
+        async with self.answer_lock:
+            self.answers_started += 1
+            capitalized_text = self.format_question(text)
+            eel.update_ui(f"Q: {capitalized_text}", "")  # Update UI with the question
+            self.set_activity(is_speaking=True)
+            try:
+                await self.get_ai_response(capitalized_text)  # Stream AI's response to the UI
+            finally:
+                self.set_activity(is_speaking=False)
+                self.last_speak_time = time.time()  # Update the last speak time
+
+    def listen_pooled(self, buffer, timeout, phrase_time_limit):
+        # Record one phrase like recognizer.listen does, but into a PcmBuffer that is reused for
+        # other utterances instead of joining a new bytes object each time. The returned audio
+        # refers to that buffer, so it is only valid until the buffer is reused.
+        source, recognizer = self.source, self.recognizer
+        seconds_per_buffer = source.CHUNK / source.SAMPLE_RATE
+        chunk_bytes = source.CHUNK * source.SAMPLE_WIDTH
+        pause_buffer_count = math.ceil(recognizer.pause_threshold / seconds_per_buffer)
+        phrase_buffer_count = math.ceil(recognizer.phrase_threshold / seconds_per_buffer)
+        non_speaking_buffer_count = max(math.ceil(recognizer.non_speaking_duration / seconds_per_buffer), 1)
+
+        # Room for the audio kept from before the phrase plus the longest allowed phrase
+        capacity = chunk_bytes * (non_speaking_buffer_count + math.ceil(phrase_time_limit / seconds_per_buffer) + 1)
+        if len(buffer.pcm) < capacity:
+            buffer.pcm = bytearray(capacity)
+        pcm = buffer.pcm
+
+        elapsed_time = 0  # Seconds of audio read so far
+        while True:
+            # Wait for the phrase to start, keeping the last few chunks so its beginning is not cut off
+            preroll = collections.deque(maxlen=non_speaking_buffer_count)
+            while True:
+                elapsed_time += seconds_per_buffer
+                if elapsed_time > timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                chunk = source.stream.read(source.CHUNK)
+                preroll.append(chunk)
+                energy = audioop.rms(chunk, source.SAMPLE_WIDTH)
+                if energy > recognizer.energy_threshold:
+                    break
+                self.adjust_energy_threshold(energy, seconds_per_buffer)
+
+            length = 0
+            for chunk in preroll:
+                pcm[length:length + len(chunk)] = chunk
+                length += len(chunk)
+
+            # Record until the speaker pauses or the phrase gets too long
+            pause_count, phrase_count = 0, 0
+            phrase_start_time = elapsed_time
+            while True:
+                elapsed_time += seconds_per_buffer
+                if elapsed_time - phrase_start_time > phrase_time_limit:
+                    break
+                chunk = source.stream.read(source.CHUNK)
+                pcm[length:length + len(chunk)] = chunk
+                length += len(chunk)
+                phrase_count += 1
+
+                energy = audioop.rms(chunk, source.SAMPLE_WIDTH)
+                pause_count = 0 if energy > recognizer.energy_threshold else pause_count + 1
+                if pause_count > pause_buffer_count:
+                    break
+                self.adjust_energy_threshold(energy, seconds_per_buffer)
+
+            # Keep listening if the phrase was too short to be speech
+            if phrase_count - pause_count >= phrase_buffer_count:
+                break
+
+        # Drop the trailing silence, except for the amount recognizer.listen would keep
+        length -= max(pause_count - non_speaking_buffer_count, 0) * chunk_bytes
+        return PooledAudioData(memoryview(pcm)[:length], source.SAMPLE_RATE, source.SAMPLE_WIDTH, buffer.wav_file)
+
+    def adjust_energy_threshold(self, energy, seconds_per_buffer):
+        # Follow the background noise level the same way recognizer.listen does
+        recognizer = self.recognizer
+        if recognizer.dynamic_energy_threshold:
+            damping = recognizer.dynamic_energy_adjustment_damping ** seconds_per_buffer
+            target_energy = energy * recognizer.dynamic_energy_ratio
+            recognizer.energy_threshold = recognizer.energy_threshold * damping + target_energy * (1 - damping)
+
+    @staticmethod
+    def format_question(text):
+        # Capitalize the first letter and ensure it ends with a question mark
+        capitalized_text = text[0].upper() + text[1:]
+        if not capitalized_text.endswith('?'):
+            capitalized_text += '?'
+        return capitalized_text
+
+    def listen_vosk(self, timeout, phrase_time_limit):
+        # Feed microphone audio to Vosk until it reports the end of an utterance, showing the
+        # partial transcript in the UI meanwhile. Raises the same errors as recognizer.listen.
+        seconds_per_chunk = self.source.CHUNK / self.source.SAMPLE_RATE
+        elapsed = 0  # Seconds of audio read so far
+        speech_start = None  # When the first words were recognized
+        partial = ""
+        partial_since = 0  # When the partial transcript last changed
+        prefilled = False  # Whether an answer was already requested for this partial transcript
+        vad_audio = bytearray()  # Audio not yet checked by the VAD, less than one frame
+        vad_frame_bytes = self.source.SAMPLE_RATE * VAD_FRAME_MS // 1000 * self.source.SAMPLE_WIDTH
+        silence = 0  # Seconds of non-speech since the VAD last heard speech
+        try:
+            while True:
+                chunk = self.source.stream.read(self.source.CHUNK)
+                elapsed += seconds_per_chunk
+                if self.vad is not None:
+                    vad_audio += chunk
+                    while len(vad_audio) >= vad_frame_bytes:
+                        frame = bytes(vad_audio[:vad_frame_bytes])
+                        del vad_audio[:vad_frame_bytes]
+                        if self.vad.is_speech(frame, self.source.SAMPLE_RATE):
+                            silence = 0
+                        else:
+                            silence += VAD_FRAME_MS / 1000
+                if self.vosk.AcceptWaveform(chunk):
+                    text = orjson.loads(self.vosk.Result())["text"]
+                    if text:
+                        return text
+                else:
+                    new_partial = orjson.loads(self.vosk.PartialResult())["partial"]
+                    if new_partial != partial:
+                        partial = new_partial
+                        partial_since = elapsed
+                        prefilled = False
+                        eel.update_ui_partial(partial)  # Show the question while it is being asked
+                    if (not prefilled and len(partial.split()) >= PREFILL_MIN_WORDS
+                            and (elapsed - partial_since > PREFILL_STABLE_SECONDS
+                                 or silence >= PREFILL_SILENCE_SECONDS)):
+                        # Start answering while the end of the question is still being detected
+                        prefilled = True
+                        self.loop.call_soon_threadsafe(self.start_prefill, self.format_question(partial))
+                    if partial and speech_start is None:
+                        speech_start = elapsed
+
+                if partial and silence >= VAD_SILENCE_SECONDS:
+                    # The speaker has stopped; finish the utterance without waiting for Vosk
+                    text = orjson.loads(self.vosk.FinalResult())["text"]
+                    if text:
+                        return text
+                    raise sr.UnknownValueError()
+                if speech_start is None and elapsed > timeout:
+                    self.vosk.FinalResult()  # Discard any unrecognized noise
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                if speech_start is not None and elapsed - speech_start > phrase_time_limit:
+                    text = orjson.loads(self.vosk.FinalResult())["text"]
+                    if text:
+                        return text
+                    raise sr.UnknownValueError()
+        finally:
+            if partial:
+                eel.update_ui_partial("")  # The final question replaces the partial one
+
+    def start_prefill(self, question):
+        # Speculatively open an answer stream for a partial question (runs on the event loop)
+        self.cancel_prefill()
+        self.prefill = (question, asyncio.create_task(self.open_chat_stream(question)))
+
+    def cancel_prefill(self):
+        # Abandon the speculative answer, closing its stream if it was already opened
+        if self.prefill is None:
+            return
+        _, task = self.prefill
+        self.prefill = None
+        task.cancel()
+        task.add_done_callback(self.close_chat_stream)
+
+    @staticmethod
+    def close_chat_stream(task):
+        # Close the answer stream opened by a finished task
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(task.result().close())
+
+    async def take_prefill(self, question):
+        # Return the speculative answer stream if it was started from (nearly) the same question
+        if self.prefill is None:
+            return None
+        partial, task = self.prefill
+        if difflib.SequenceMatcher(None, partial.lower(), question.lower()).ratio() <= PREFILL_SIMILARITY:
+            self.cancel_prefill()
+            return None
+        self.prefill = None
+        try:
+            return await task
+        except Exception as e:
+            print(f"Error in take_prefill: {str(e)}")  # Debugging line
+            return None
+
+    def set_activity(self, **flags):
+        # Update is_speaking/audio_playing and wake the listen loop once both are off.
+        # Changes are applied on the event loop so they never interleave with each other.
+        def apply():
+            for name, value in flags.items():
+                setattr(self, name, value)
+            if self.is_speaking or self.audio_playing:
+                self.idle.clear()
             else:
-                time.sleep(0.1)  # Short sleep to prevent busy waiting
-
-    def is_question(self, text):
-        # Check if the text is a question
-        text = text.lower().strip()  # Convert to lowercase and remove extra spaces
-        
-        # List of question words and phrases
-        question_starters = [
-            "what", "why", "how", "when", "where", "who", "which",
-            "can", "could", "would", "should", "is", "are", "do", "does",
-            "am", "was", "were", "have", "has", "had", "will", "shall"
-        ]
-        
-        # Check if the text starts with a question word
-        if any(text.startswith(starter) for starter in question_starters):
-            return True
-        
-        # Check for a question mark at the end
-        if text.endswith('?'):
-            return True
-        
-        # Check for inverted word order (e.g., "Are you...?", "Can we...?")
-        if re.match(r'^(are|can|could|do|does|have|has|will|shall|should|would|am|is)\s', text):
-            return True
-        
-        # Check for specific phrases that indicate a question
-        question_phrases = [
-            "tell me about", "i'd like to know", "can you explain",
-            "i was wondering", "do you know", "what about", "how about"
-        ]
-        if any(phrase in text for phrase in question_phrases):
-            return True
-        
-        # If none of the above conditions are met, it's probably not a question
-        return False
+                self.idle.set()
+        self.loop.call_soon_threadsafe(apply)
+
+    async def realtime_session(self):
+        # Stream the microphone to OpenAI's Realtime API and play its spoken answers as they arrive
+        loop = asyncio.get_running_loop()
+        frames = asyncio.Queue()  # Microphone frames waiting to be sent
+
+        def on_audio(indata, frame_count, time_info, status):
+            # Called on the audio thread for every captured frame; skip frames while the
+            # assistant is answering so it does not hear itself
+            if self.idle.is_set():
+                loop.call_soon_threadsafe(frames.put_nowait, bytes(indata))
 
-    def get_ai_response(self, question):
-        # Send the question to the OpenAI model and get the response
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",  # Use GPT-3.5 model
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},  # Set system message
-                    {"role": "user", "content": question}  # Send the user's question
-                ]
-            )
-            # Extract the response text
-            text_response = response.choices[0].message.content.strip()
-            
-            # If text-to-speech is enabled, generate speech from the text
+            async with self.client.beta.realtime.connect(model=REALTIME_MODEL) as connection:
+                await connection.session.update(session={
+                    "modalities": ["text", "audio"],
+                    "instructions": "You are a helpful assistant.",
+                    "voice": TTS_VOICE,
+                    "input_audio_format": "pcm16",
+                    "output_audio_format": "pcm16",
+                    "input_audio_transcription": {"model": "whisper-1"},  # Show the questions in the UI
+                    "turn_detection": {"type": "server_vad"},  # Let the server detect the end of each question
+                })
+                # Keep the microphone open for the whole session
+                with sd.RawInputStream(samplerate=REALTIME_SAMPLE_RATE, channels=1, dtype='int16',
+                                       blocksize=REALTIME_SAMPLE_RATE * REALTIME_FRAME_MS // 1000,
+                                       callback=on_audio):
+                    sender = asyncio.create_task(self.send_realtime_audio(connection, frames))
+                    try:
+                        async for event in connection:
+                            self.handle_realtime_event(event)
+                    finally:
+                        sender.cancel()
+        except Exception as e:
+            eel.update_ui(f"An error occurred: {str(e)}", "")  # Handle general errors
+        finally:
+            self.set_activity(is_speaking=False)
+
+    async def send_realtime_audio(self, connection, frames):
+        # Forward microphone frames to the Realtime API until listening is switched off
+        while self.is_listening:
+            try:
+                frame = await asyncio.wait_for(frames.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            await connection.input_audio_buffer.append(audio=base64.b64encode(frame).decode('utf-8'))
+        await connection.close()  # Ends the event loop in realtime_session
+
+    def handle_realtime_event(self, event):
+        # Forward Realtime API events to the UI
+        if event.type == "conversation.item.input_audio_transcription.completed":
+            question = event.transcript.strip()
+            if question:
+                eel.update_ui(f"Q: {question[0].upper() + question[1:]}", "")  # Update UI with the question
+        elif event.type == "response.created":
+            self.set_activity(is_speaking=True)
+            self.begin_answer()
+        elif event.type == "response.audio_transcript.delta":
+            self.stream_server.send_text(event.delta)  # Show the answer text as it is spoken
+        elif event.type == "response.audio.delta":
             if self.tts_enabled:
-                speech_response = self.client.audio.speech.create(
-                    model="tts-1",  # Use the text-to-speech model
-                    voice="alloy",  # Set the voice model
-                    input=text_response  # Provide the text to convert to speech
-                )
-                
-                # Encode the speech in base64 and return both text and audio
-                audio_base64 = base64.b64encode(speech_response.content).decode('utf-8')
-                return json.dumps({"text": text_response, "audio": audio_base64})
-            
-            # If TTS is not enabled, only return the text
-            return json.dumps({"text": text_response, "audio": None})
+                # PCM16 audio, played as soon as it arrives
+                self.stream_server.send(StreamServer.AUDIO_PCM, base64.b64decode(event.delta))
+                if self.stream_server.clients and not self.audio_playing:
+                    # Count the audio as playing right away; response.done can arrive before the
+                    # browser reports that it started, and is_speaking alone would then let the
+                    # microphone hear the end of the answer
+                    self.set_activity(audio_playing=True)
+        elif event.type == "response.done":
+            # Gaps in playback only clear audio_playing, so this is the only place a Realtime
+            # answer stops counting as speaking
+            self.set_activity(is_speaking=False)
+        elif event.type == "error":
+            eel.update_ui(f"An error occurred: {event.error.message}", "")
+
+    async def get_ai_response(self, question):
+        # Stream the answer from the OpenAI model, forwarding text to the UI as it is generated
+        self.begin_answer()
+        try:
+            # Reuse the answer to an identical or similar question if there is one
+            embedding = None
+            cached = self.response_cache.get_exact(question)
+            if cached is None:
+                embedding = await self.get_embedding(question)
+                if embedding is not None:
+                    cached = self.response_cache.search(embedding)
+            if cached is not None:
+                self.cancel_prefill()
+                await self.replay_answer(*cached)
+                return cached[0]
+
+            # Continue the answer started from the partial question, or ask now
+            response = await self.take_prefill(question) or await self.open_chat_stream(question)
+            text_response = ""  # The full answer received so far
+            pending = ""  # Text not yet handed to text-to-speech
+            sentences = []  # The pieces of the answer handed to text-to-speech
+            async for chunk in response:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                text_response += delta
+                pending += delta
+                self.stream_server.send_text(delta)  # Show the new text almost immediately
+
+                # Send every completed sentence to text-to-speech while the rest is still generating.
+                # Punctuation only ends a sentence once whitespace follows it, so "3.5" stays whole.
+                end = 0
+                for match in SENTENCE_RE.finditer(pending):
+                    if match.end() == len(pending):
+                        break
+                    if match.group()[-1] == '\n' or pending[match.end()].isspace():
+                        sentences.append(pending[end:match.end()].strip())
+                        self.speak(sentences[-1])
+                        end = match.end()
+                pending = pending[end:]
+
+            sentences.append(pending.strip())
+            self.speak(sentences[-1])  # Speak whatever is left after the last sentence
+            self.stream_server.flush_text()
+            await self.tts_queue.join()  # Wait until every sentence has been sent to the UI as audio
+
+            # Cache the answer; its speech stays in the TTS cache
+            text_response = text_response.strip()
+            if embedding is not None and text_response:
+                self.response_cache.add(question, embedding, text_response, [sentence for sentence in sentences if sentence])
+                await asyncio.get_running_loop().run_in_executor(None, self.response_cache.save)
+            return text_response
         except Exception as e:
             print(f"Error in get_ai_response: {str(e)}")  # Debugging line
-            return json.dumps({"text": f"Error getting AI response: {str(e)}", "audio": None})
+            self.stream_server.flush_text()  # Keep the error after any text already received
+            error = f"Error getting AI response: {str(e)}"
+            self.stream_server.send(StreamServer.ERROR, msgpack.packb({"t": error}))
+            return None
+
+    def begin_answer(self):
+        # Start a new answer in the UI once the text of the previous one has been sent; the marker
+        # goes over the stream server so it stays ordered with the answer's text and audio
+        self.stream_server.flush_text()
+        self.stream_server.send(StreamServer.BEGIN_ANSWER, b"")
+
+    def open_chat_stream(self, question):
+        # Ask the OpenAI model to stream an answer to the question
+        return self.client.chat.completions.create(
+            model="gpt-3.5-turbo",  # Use GPT-3.5 model
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant."},  # Set system message
+                {"role": "user", "content": question}  # Send the user's question
+            ],
+            stream=True  # Receive the answer token by token
+        )
+
+    async def get_embedding(self, text):
+        # Embed the text for the response cache; the cache is skipped if this fails
+        try:
+            response = await self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+            return response.data[0].embedding
+        except Exception as e:
+            print(f"Error in get_embedding: {str(e)}")  # Debugging line
+            return None
+
+    async def replay_answer(self, text_response, sentences):
+        # Send a cached answer to the UI; its speech is normally still in the TTS cache, so
+        # OpenAI is only contacted for sentences that were evicted since
+        self.stream_server.send_text(text_response)
+        for sentence in sentences:
+            self.speak(sentence)
+        self.stream_server.flush_text()
+        await self.tts_queue.join()
+
+    def speak(self, text):
+        # Start synthesizing a piece of the answer if text-to-speech is enabled
+        text = text.strip()
+        if self.tts_enabled and text:
+            self.tts_queue.put_nowait(asyncio.create_task(self.synthesize(text)))
+
+    async def preload_canned_speech(self):
+        # Synthesize CANNED_PHRASES in the background so they can be spoken without any request
+        results = await asyncio.gather(*(self.synthesize(phrase) for phrase in CANNED_PHRASES), return_exceptions=True)
+        for phrase, audio in zip(CANNED_PHRASES, results):
+            if isinstance(audio, bytes):
+                self.canned_speech[phrase] = audio
+
+    async def synthesize(self, text):
+        # Return the speech for the text, from memory or the cache if it was spoken before
+        audio = self.canned_speech.get(text)
+        if audio is not None:
+            return audio
+        audio = self.tts_cache.get(TTS_VOICE, text)
+        if audio is None:
+            async with self.tts_slots:  # Sentences queue here in order when many are ready at once
+                speech_response = await self.client.audio.speech.create(
+                    model="tts-1",  # Use the text-to-speech model
+                    voice=TTS_VOICE,  # Set the voice model
+                    input=text,  # Provide the text to convert to speech
+                    response_format=TTS_FORMAT
+                )
+            audio = speech_response.content
+            self.tts_cache.put(TTS_VOICE, text, audio)
+        return audio
+
+    async def tts_worker(self):
+        # Sentences are synthesized in parallel; send their speech to the UI in the order they were spoken
+        while True:
+            task = await self.tts_queue.get()
+            try:
+                audio = await task
+                self.stream_server.send(StreamServer.AUDIO_CLIP, audio)  # Send the speech to the UI
+            except Exception as e:
+                print(f"Error in tts_worker: {str(e)}")  # Debugging line
+            finally:
+                self.tts_queue.task_done()
 
 # Initialize the AudioAssistant class
 assistant = AudioAssistant()
 
 # Expose functions to the front-end via eel
+@eel.expose
+def get_stream_port():
+    return assistant.stream_server.port  # Port the browser connects to for audio
+
 @eel.expose
 def toggle_listening():
     return assistant.toggle_listening()
@@ -203,16 +1016,20 @@ def toggle_tts():
 
 @eel.expose
 def speaking_ended():
-    assistant.is_speaking = False  # Indicate that speaking has ended
+    assistant.set_activity(is_speaking=False)  # Indicate that speaking has ended
 
 @eel.expose
 def audio_playback_started():
-    assistant.audio_playing = True  # Indicate that audio playback has started
+    assistant.set_activity(audio_playing=True)  # Indicate that audio playback has started
 
 @eel.expose
 def audio_playback_ended():
-    assistant.audio_playing = False  # Indicate that audio playback has ended
-    assistant.is_speaking = False  # Reset speaking state
+    # Playback also stops between sentences whose speech has not arrived yet, so only the backend
+    # decides when the answer itself is over
+    assistant.set_activity(audio_playing=False)
 
 # Start the eel web interface
-eel.start('index.html', size=(960, 840))
+try:
+    eel.start('index.html', size=(960, 840), port=EEL_PORT)
+finally:
+    assistant.shutdown()
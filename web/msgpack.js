@@ -0,0 +1,80 @@
+// Minimal MessagePack decoder for the messages sent by the backend's stream server.
+// Served with the app so the UI does not depend on a CDN; exposes MessagePack.decode
+// like the @msgpack/msgpack bundle did. Extension types are not supported.
+const MessagePack = (function() {
+    const textDecoder = new TextDecoder();
+
+    function decode(bytes) {
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+
+        function readString(length) {
+            const text = textDecoder.decode(bytes.subarray(offset, offset + length));
+            offset += length;
+            return text;
+        }
+
+        function readBinary(length) {
+            const data = bytes.slice(offset, offset + length);
+            offset += length;
+            return data;
+        }
+
+        function readArray(length) {
+            const array = new Array(length);
+            for (let i = 0; i < length; i++) {
+                array[i] = readValue();
+            }
+            return array;
+        }
+
+        function readMap(length) {
+            const map = {};
+            for (let i = 0; i < length; i++) {
+                const key = readValue();
+                map[key] = readValue();
+            }
+            return map;
+        }
+
+        function readValue() {
+            const type = view.getUint8(offset++);
+            let value;
+            if (type <= 0x7f) return type;  // positive fixint
+            if (type >= 0xe0) return type - 0x100;  // negative fixint
+            if (type >= 0x80 && type <= 0x8f) return readMap(type & 0x0f);
+            if (type >= 0x90 && type <= 0x9f) return readArray(type & 0x0f);
+            if (type >= 0xa0 && type <= 0xbf) return readString(type & 0x1f);
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: value = view.getUint8(offset); offset += 1; return readBinary(value);
+                case 0xc5: value = view.getUint16(offset); offset += 2; return readBinary(value);
+                case 0xc6: value = view.getUint32(offset); offset += 4; return readBinary(value);
+                case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+                case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+                case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+                case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+                case 0xce: value = view.getUint32(offset); offset += 4; return value;
+                case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+                case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+                case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+                case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+                case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+                case 0xd9: value = view.getUint8(offset); offset += 1; return readString(value);
+                case 0xda: value = view.getUint16(offset); offset += 2; return readString(value);
+                case 0xdb: value = view.getUint32(offset); offset += 4; return readString(value);
+                case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+                case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+                case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+                case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+            }
+            throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+        }
+
+        return readValue();
+    }
+
+    return {decode: decode};
+})();
@@ -23,9 +23,11 @@ closeLogo.addEventListener('click', () => {
 window.addEventListener('load', async () => {
     const hasApiKey = await eel.has_api_key()();
     updateApiKeyUI(hasApiKey);
+    connectStream();
 });
 
 listenButton.addEventListener('click', async () => {
+    getAudioContext().resume();  // Browsers only allow audio to start after a user gesture
     let isListening = await eel.toggle_listening()();
     listenButton.textContent = isListening ? 'Stop Listening' : 'Start Listening';
     listenButton.classList.toggle('listening', isListening);
@@ -40,6 +42,8 @@ listenButton.addEventListener('click', async () => {
 clearButton.addEventListener('click', () => {
     questionsArea.innerHTML = '';
     answersArea.innerHTML = '';
+    partialQuestion = null;
+    currentAnswer = null;
 });
 
 saveApiKeyButton.addEventListener('click', async () => {
@@ -97,6 +101,45 @@ window.onclick = function(event) {
     }
 }
 
+let partialQuestion = null;  // The question currently being recognized
+let currentAnswer = null;  // The answer currently being streamed from the backend
+let audioContext = null;  // Plays the answer audio streamed from the backend
+let playbackTime = 0;  // When the next audio chunk should start playing
+let sourcesPlaying = 0;  // Number of audio chunks scheduled but not yet finished
+let clipQueue = Promise.resolve();  // Schedules decoded clips in the order they arrived
+
+// Types of the binary messages sent by the backend's stream server (first byte of each message)
+const AUDIO_CLIP = 0;  // An encoded audio file
+const AUDIO_PCM = 1;  // Raw 24 kHz PCM16 samples from the Realtime API
+const TEXT = 2;  // A msgpack map {t: text} with a batch of answer text
+const BEGIN_ANSWER = 3;  // No payload; the messages after it belong to a new answer
+const ERROR = 4;  // A msgpack map {t: text} with an error shown in place of the answer
+
+async function connectStream() {
+    // Answer audio and text arrive as binary WebSocket messages instead of eel calls
+    const port = await eel.get_stream_port()();
+    let socket = new WebSocket(`ws://127.0.0.1:${port}`);
+    socket.binaryType = 'arraybuffer';
+    socket.onmessage = function(event) {
+        const kind = new Uint8Array(event.data, 0, 1)[0];
+        const payload = event.data.slice(1);
+        if (kind === AUDIO_CLIP) {
+            playClip(payload);
+        } else if (kind === AUDIO_PCM) {
+            playPcm(payload);
+        } else if (kind === TEXT) {
+            update_ui_stream(MessagePack.decode(new Uint8Array(payload)).t);
+        } else if (kind === ERROR) {
+            show_answer_error(MessagePack.decode(new Uint8Array(payload)).t);
+        } else if (kind === BEGIN_ANSWER) {
+            begin_answer();
+        }
+    };
+    socket.onclose = function() {
+        setTimeout(connectStream, 1000);  // Reconnect if the backend restarts the server
+    };
+}
+
 eel.expose(update_ui);
 function update_ui(question, answer) {
     if (question) {
@@ -106,45 +149,127 @@ function update_ui(question, answer) {
         questionsArea.scrollTop = questionsArea.scrollHeight;
     }
     if (answer) {
+        update_ui_stream(answer);
+    }
+}
+
+eel.expose(update_ui_partial);
+function update_ui_partial(text) {
+    if (!text) {
+        if (partialQuestion) {
+            partialQuestion.remove();
+            partialQuestion = null;
+        }
+        return;
+    }
+    if (!partialQuestion) {
+        partialQuestion = document.createElement('p');
+        partialQuestion.className = 'partial-question';
+        questionsArea.appendChild(partialQuestion);
+    }
+    partialQuestion.textContent = text;
+    questionsArea.scrollTop = questionsArea.scrollHeight;
+}
+
+function begin_answer() {
+    currentAnswer = null;  // The next streamed text starts a new answer
+}
+
+function update_ui_stream(textDelta) {
+    let answer = getCurrentAnswer();
+    answer.text.textContent += textDelta;
+    answersArea.scrollTop = answersArea.scrollHeight;
+}
+
+function show_answer_error(message) {
+    // Show the error on its own line below whatever part of the answer was received
+    let p = document.createElement('p');
+    p.textContent = message;
+    getCurrentAnswer().container.appendChild(p);
+    answersArea.scrollTop = answersArea.scrollHeight;
+}
+
+function getCurrentAnswer() {
+    if (!currentAnswer) {
         let answerContainer = document.createElement('div');
         answerContainer.className = 'answer-container';
-        
+
         let p = document.createElement('p');
-        try {
-            const parsedAnswer = JSON.parse(answer);
-            p.textContent = parsedAnswer.text;
-            
-            if (parsedAnswer.audio) {
-                let audio = new Audio(`data:audio/mp3;base64,${parsedAnswer.audio}`);
-                audio.onplay = function() {
-                    eel.audio_playback_started()();
-                };
-                audio.onended = function() {
-                    eel.audio_playback_ended()();
-                };
-                
-                let muteIcon = document.createElement('span');
-                muteIcon.className = 'mute-icon';
-                muteIcon.innerHTML = '🔊';
-                muteIcon.title = 'Mute/Unmute';
-                muteIcon.onclick = function() {
-                    audio.muted = !audio.muted;
-                    muteIcon.innerHTML = audio.muted ? '🔇' : '🔊';
-                };
-                
-                answerContainer.appendChild(muteIcon);
-                
-                audio.play().catch(e => console.error("Error playing audio:", e));
-            }
-        } catch (e) {
-            console.error("Error parsing answer:", e);
-            p.textContent = answer;
-        }
-        
         answerContainer.appendChild(p);
         answersArea.appendChild(answerContainer);
-        answersArea.scrollTop = answersArea.scrollHeight;
+
+        currentAnswer = {container: answerContainer, text: p, gain: null};
+    }
+    return currentAnswer;
+}
+
+function getAudioContext() {
+    if (!audioContext) {
+        audioContext = new AudioContext();
+    }
+    return audioContext;
+}
+
+function getAnswerOutput(answer) {
+    // Each answer plays through its own gain node so its mute icon only affects that answer
+    if (!answer.gain) {
+        answer.gain = getAudioContext().createGain();
+        answer.gain.connect(getAudioContext().destination);
+
+        let muteIcon = document.createElement('span');
+        muteIcon.className = 'mute-icon';
+        muteIcon.innerHTML = '🔊';
+        muteIcon.title = 'Mute/Unmute';
+        muteIcon.onclick = function() {
+            const muted = answer.gain.gain.value === 0;
+            answer.gain.gain.value = muted ? 1 : 0;
+            muteIcon.innerHTML = muted ? '🔊' : '🔇';
+        };
+        answer.container.insertBefore(muteIcon, answer.text);
+    }
+    return answer.gain;
+}
+
+function playClip(data) {
+    // Decode right away, but schedule clips in arrival order so sentences are never swapped
+    let answer = getCurrentAnswer();
+    let decoded = getAudioContext().decodeAudioData(data);
+    clipQueue = clipQueue
+        .then(() => decoded)
+        .then(buffer => scheduleBuffer(answer, buffer))
+        .catch(e => console.error("Error playing audio:", e));
+}
+
+function playPcm(data) {
+    // Convert little-endian PCM16 samples to the float samples Web Audio expects
+    const samples = new Int16Array(data);
+    const buffer = getAudioContext().createBuffer(1, samples.length, 24000);
+    const channel = buffer.getChannelData(0);
+    for (let i = 0; i < samples.length; i++) {
+        channel[i] = samples[i] / 32768;
+    }
+    scheduleBuffer(getCurrentAnswer(), buffer);
+}
+
+function scheduleBuffer(answer, buffer) {
+    // Play the buffer right after the previous one so playback is gapless
+    const source = getAudioContext().createBufferSource();
+    source.buffer = buffer;
+    source.connect(getAnswerOutput(answer));
+    source.onended = function() {
+        sourcesPlaying--;
+        if (sourcesPlaying === 0) {
+            eel.audio_playback_ended()();
+        }
+    };
+    playbackTime = Math.max(playbackTime, audioContext.currentTime);
+    source.start(playbackTime);
+    playbackTime += buffer.duration;
+
+    if (sourcesPlaying === 0) {
+        eel.audio_playback_started()();
     }
+    sourcesPlaying++;
 }
 
 let ttsToggle = document.getElementById('ttsToggle');